@@ -3,17 +3,18 @@
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import os
-import glob
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from typing import Optional, List
+from typing import Optional, List, Tuple
 
 # Local modules
 
 from scraper import scrape_with_serpapi, scrape_with_selenium
-from database_manager import DatabaseManager
+from database_manager import DatabaseManager, save_to_excel
 
 # Load environment variables
 load_dotenv()
@@ -21,14 +22,67 @@ load_dotenv()
 # Page Configuration
 st.set_page_config(page_title="CityPulse AI: Market Intelligence", layout="wide", page_icon="🏙️")
 
+def prepare_data(df: pd.DataFrame) -> pd.DataFrame:
+    """Normalizes column dtypes once so downstream aggregations work on compact types."""
+    if 'Shop Type' in df.columns:
+        # Categorical codes make groupby/value_counts hash ints instead of strings
+        df['Shop Type'] = df['Shop Type'].astype('category')
+    if 'Rating' in df.columns:
+        # Coerce ratings once; 'N/A' and other non-numeric entries become NaN
+        df['Rating_f'] = pd.to_numeric(df['Rating'].replace('N/A', np.nan), errors='coerce')
+    for col in ('Website', 'Phone'):
+        if col in df.columns:
+            # Arrow-backed strings strip in one C kernel and keep nulls native
+            df[col] = df[col].astype("string[pyarrow]")
+    return df
+
 def load_data(file_path: str) -> pd.DataFrame:
     """Loads Excel data into a Pandas DataFrame."""
     try:
-        return pd.read_excel(file_path)
+        return prepare_data(pd.read_excel(file_path))
     except Exception as e:
         st.error(f"Error loading file: {e}")
         return pd.DataFrame()
 
+def _group_sums(categories: pd.Series, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sums `values` per category in a single pass over the categorical codes.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (sums, counts), both indexed by category code.
+    """
+    codes = categories.cat.codes.to_numpy()
+    present = codes >= 0
+    n = len(categories.cat.categories)
+    sums = np.bincount(codes[present], weights=values[present], minlength=n)
+    counts = np.bincount(codes[present], minlength=n)
+    return sums, counts
+
+def _prep_ratings(df: pd.DataFrame) -> Tuple[np.ndarray, pd.Series]:
+    """Returns the valid ratings as floats and the mean rating per 'Shop Type'."""
+    ratings = df['Rating_f'].to_numpy(dtype=float)
+    valid = ~np.isnan(ratings)
+    cat_means = pd.Series(dtype=float)
+    if 'Shop Type' in df.columns:
+        sums, counts = _group_sums(df['Shop Type'][valid], ratings[valid])
+        seen = counts > 0
+        cat_means = pd.Series(sums[seen] / counts[seen], index=df['Shop Type'].cat.categories[seen])
+    return ratings[valid], cat_means
+
+@st.cache_resource(show_spinner=False)
+def get_secret(key_name: str) -> Optional[str]:
+    """
+    Reads a secret from `st.secrets`, falling back to environment variables (.env).
+
+    Cached with st.cache_resource, which survives script reruns, so each key
+    is resolved once per server process rather than on every interaction.
+    """
+    try:
+        return st.secrets.get(key_name) or os.getenv(key_name)
+    except FileNotFoundError:
+        # No secrets.toml on local machines
+        return os.getenv(key_name)
+
 def main() -> None:
     """Main function for the Streamlit Dashboard."""
     
@@ -46,22 +100,12 @@ def main() -> None:
     # This checks prevents crashes on local machines without secrets.toml.
     
     default_gemini_key = ""
-    default_serp_key = ""
-    
-    # helper for safely accessing secrets
-    def get_secret(key_name):
-        try:
-            return st.secrets[key_name] if key_name in st.secrets else os.getenv(key_name)
-        except:
-            return os.getenv(key_name)
-
     default_serp_key = get_secret("SERPAPI_KEY") or ""
+    supabase_url = get_secret("SUPABASE_URL")
+    supabase_key = get_secret("SUPABASE_KEY")
     
     # Allow user to override keys in the UI (good for demos)
     api_key_serp = st.sidebar.text_input("SerpApi Key", value=default_serp_key, type="password")
-    
-    supabase_url = get_secret("SUPABASE_URL")
-    supabase_key = get_secret("SUPABASE_KEY")
 
     # --- SECTION 1: LIVE SCRAPER ---
     with st.expander("🔍 **Start New Scrape**", expanded=True):
@@ -100,17 +144,20 @@ def main() -> None:
                         
                     # 3. Save & Process
                     if scraped_data:
-                        # Save Local
                         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                         filename = f"{target_city}_{timestamp}.xlsx"
-                        pd.DataFrame(scraped_data).to_excel(filename, index=False)
-                        
-                        # Save Cloud
+                        df_scraped = pd.DataFrame(scraped_data)
                         db = DatabaseManager(supabase_url, supabase_key)
-                        db.save_data(scraped_data)
+                        
+                        # Save Local & Cloud in parallel (both are I/O bound)
+                        with ThreadPoolExecutor(max_workers=2) as pool:
+                            fut_xlsx = pool.submit(save_to_excel, df_scraped, filename)
+                            fut_db = pool.submit(db.save_data, scraped_data)
+                            fut_xlsx.result()
+                            fut_db.result()
                         
                         # UPDATE SESSION STATE (Critical for Privacy)
-                        st.session_state['scraped_data'] = pd.DataFrame(scraped_data)
+                        st.session_state['scraped_data'] = prepare_data(df_scraped)
                         
                         st.success(f"Success! Found {len(scraped_data)} shops. Data saved to {filename}")
                         # Rerun to update the dashboard below immediately
@@ -144,21 +191,17 @@ def main() -> None:
         
         # Calculate Average Rating safely
         avg_rating = 0.0
-        if 'Rating' in df.columns:
-            valid_ratings = df[df['Rating'] != 'N/A']['Rating']
-            valid_ratings = pd.to_numeric(valid_ratings, errors='coerce').dropna()
-            if not valid_ratings.empty:
+        top_category = "N/A"
+        valid_ratings = np.empty(0)
+        cat_means = pd.Series(dtype=float)
+        if 'Rating_f' in df.columns:
+            valid_ratings, cat_means = _prep_ratings(df)
+            if valid_ratings.size:
                 avg_rating = valid_ratings.mean()
             
-        # Determine Highest Rated Category
-        top_category = "N/A"
-        if 'Shop Type' in df.columns and 'Rating' in df.columns:
-            cat_ratings = df[df['Rating'] != 'N/A'].copy()
-            cat_ratings['Rating'] = pd.to_numeric(cat_ratings['Rating'], errors='coerce')
-            if not cat_ratings.empty:
-                best_cat = cat_ratings.groupby('Shop Type')['Rating'].mean().idxmax()
-                top_rating = cat_ratings.groupby('Shop Type')['Rating'].mean().max()
-                top_category = f"{best_cat} ({top_rating:.1f}⭐)"
+            # Determine Highest Rated Category
+            if not cat_means.empty:
+                top_category = f"{cat_means.idxmax()} ({cat_means.max():.1f}⭐)"
         
         col1.metric("Total Shops Scraped", total_shops)
         col2.metric("Average Rating", f"{avg_rating:.2f}")
@@ -168,13 +211,17 @@ def main() -> None:
         col_charts1, col_charts2 = st.columns(2)
         with col_charts1:
             if 'Shop Type' in df.columns:
-                fig_cat = px.pie(df, names='Shop Type', title="Category Distribution (Sampled)", hole=0.4)
+                # Send per-category counts to Plotly rather than every row
+                cat_counts = df['Shop Type'].value_counts()
+                fig_cat = px.pie(names=cat_counts.index, values=cat_counts.values, title="Category Distribution (Sampled)", hole=0.4)
                 st.plotly_chart(fig_cat, use_container_width=True)
         with col_charts2:
-            if 'Rating' in df.columns:
-                current_valid_ratings = df[df['Rating'] != 'N/A'].copy()
-                current_valid_ratings['Rating'] = pd.to_numeric(current_valid_ratings['Rating'], errors='coerce')
-                fig_hist = px.histogram(current_valid_ratings, x="Rating", nbins=10, title="Rating Distribution", color_discrete_sequence=['#4CAF50'])
+            if 'Rating_f' in df.columns:
+                # Bin server-side so the chart payload is O(bins) instead of O(rows)
+                bin_counts, edges = np.histogram(valid_ratings, bins=10)
+                centers = 0.5 * (edges[1:] + edges[:-1])
+                fig_hist = px.bar(x=centers, y=bin_counts, labels={"x": "Rating", "y": "count"}, title="Rating Distribution", color_discrete_sequence=['#4CAF50'])
+                fig_hist.update_layout(bargap=0)
                 st.plotly_chart(fig_hist, use_container_width=True)
         
         # Market Intelligence
@@ -183,21 +230,21 @@ def main() -> None:
         
         if st.button("Generate Market Analysis"):
             with st.spinner("Analyzing data patterns..."):
-                # Recalculate for report (ensuring scope)
-                cat_ratings = df[df['Rating'] != 'N/A'].copy()
-                cat_ratings['Rating'] = pd.to_numeric(cat_ratings['Rating'], errors='coerce')
+                # Reuse the per-category means computed for the metrics above
                 best_sector = "N/A"
                 best_rating = 0.0
-                if not cat_ratings.empty:
-                    best_sector = cat_ratings.groupby('Shop Type')['Rating'].mean().idxmax()
-                    best_rating = cat_ratings.groupby('Shop Type')['Rating'].mean().max()
+                if not cat_means.empty:
+                    best_sector = cat_means.idxmax()
+                    best_rating = cat_means.max()
                 
                 df['Reviews'] = pd.to_numeric(df['Reviews'], errors='coerce').fillna(0)
                 most_reviews = "N/A"
                 total_reviews = 0
-                if not df.empty:
-                    most_reviews = df.groupby('Shop Type')['Reviews'].sum().idxmax()
-                    total_reviews = df.groupby('Shop Type')['Reviews'].sum().max()
+                review_sums, shop_counts = _group_sums(df['Shop Type'], df['Reviews'].to_numpy(dtype=float))
+                if shop_counts.any():
+                    best = np.where(shop_counts > 0, review_sums, -np.inf).argmax()
+                    most_reviews = df['Shop Type'].cat.categories[best]
+                    total_reviews = review_sums[best]
                 
                 counts = df['Shop Type'].value_counts()
                 rare_sector = "N/A"
@@ -221,7 +268,7 @@ def main() -> None:
     with tab2:
         st.subheader("📍 Business Locations")
         if 'latitude' in df.columns and 'longitude' in df.columns:
-            map_df = df.dropna(subset=['latitude', 'longitude'])
+            map_df = df[['latitude', 'longitude']].dropna()
             if not map_df.empty:
                 st.map(map_df)
                 st.caption(f"Showing {len(map_df)} locations based on SerpApi data.")
@@ -235,36 +282,32 @@ def main() -> None:
         st.subheader("🎯 Lead Generation (Missing Digital Presence)")
         st.caption("Businesses with missing Website or Phone are high-potential leads for Digital Marketing services.")
         
-        # 1. Standardize missing values
-        df_leads = df.copy()
-        df_leads['Website'] = df_leads['Website'].fillna("N/A").astype(str).str.strip()
-        df_leads['Phone'] = df_leads['Phone'].fillna("N/A").astype(str).str.strip()
+        # 1. Standardize missing values (columns are Arrow strings from prepare_data)
+        missing = {"N/A", "nan", ""}
+        website = df['Website'].str.strip()
+        phone = df['Phone'].str.strip()
         
-        # 2. Filter rows where Website OR Phone is "N/A" or "nan" or empty
+        # 2. Filter rows where Website OR Phone is missing, "N/A", "nan" or empty
         leads_mask = (
-            (df_leads['Website'] == 'N/A') | 
-            (df_leads['Website'] == 'nan') | 
-            (df_leads['Website'] == '') |
-            (df_leads['Phone'] == 'N/A') | 
-            (df_leads['Phone'] == 'nan') | 
-            (df_leads['Phone'] == '')
+            website.isna() | website.isin(missing) |
+            phone.isna() | phone.isin(missing)
         )
         
-        leads_df = df[leads_mask] # Use original DF to preserve other columns if needed
+        leads_df = df[leads_mask]
         
         if leads_df.empty:
             st.info("Good news! All businesses in this dataset have a Website and Phone number. (Or the data is fully populated).")
         else:
             st.metric("Potential Leads Found", len(leads_df))
-            st.dataframe(leads_df)
+            st.dataframe(leads_df, column_config={"Rating_f": None})
             
-            csv = leads_df.to_csv(index=False).encode('utf-8')
+            csv = leads_df.drop(columns=["Rating_f"], errors="ignore").to_csv(index=False).encode('utf-8')
             st.download_button("📥 Download Leads (CSV)", csv, "potential_leads.csv", "text/csv")
         
     # --- RAW DATA ---
     st.divider()
     with st.expander("📂 View Raw Data"):
-        st.dataframe(df)
+        st.dataframe(df, column_config={"Rating_f": None})
 
 if __name__ == "__main__":
     main()
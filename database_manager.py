@@ -2,28 +2,90 @@
 # Handles interactions with Supabase (Cloud) and Excel (Local)
 
 import os
+import random
+import time
+import httpx
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from supabase import create_client, Client
+from postgrest.exceptions import APIError
 from datetime import datetime
 from typing import Optional, List, Dict, Any, Tuple
 
+# =============================================================================
+# CONSTANTS
+# =============================================================================
+
+UPLOAD_BATCH_SIZE = 500       # Records per upsert request (keeps payloads bounded)
+UPLOAD_MAX_WORKERS = 4        # Concurrent batch uploads
+UPLOAD_MAX_RETRIES = 3        # Attempts per batch on transient failures
+RETRYABLE_STATUS = {"429", "500", "502", "503", "504"}
+EXPORT_PAGE_SIZE = 1000       # Supabase caps rows per select; page through the table
+
+def save_to_excel(df: pd.DataFrame, filename: str) -> None:
+    """
+    Writes a DataFrame to an Excel file with the project's xlsxwriter settings.
+
+    Args:
+        df (pd.DataFrame): Data to write.
+        filename (str): Destination .xlsx path.
+    """
+    # strings_to_urls=False keeps Website values as plain text: it skips per-cell URL
+    # detection and avoids xlsxwriter's per-sheet URL count and URL length limits.
+    # constant_memory is deliberately not enabled: pandas writes cells column by column,
+    # which that row-streaming mode silently truncates.
+    with pd.ExcelWriter(filename, engine="xlsxwriter",
+                        engine_kwargs={"options": {"strings_to_urls": False}}) as writer:
+        df.to_excel(writer, index=False)
+
+def _is_transient(error: Exception, idempotent: bool = True) -> bool:
+    """
+    Returns True for failures worth retrying: network-level errors, or an
+    APIError that carries a throttling / server-side HTTP status.
+
+    postgrest only puts the HTTP status in APIError.code when the response
+    body was not JSON; otherwise the code is a PostgREST/Postgres error code
+    (e.g. "PGRST001") or None, which we treat as non-retryable.
+
+    For non-idempotent writes (plain inserts) only connection failures are
+    retried, since the request definitely never reached the server; a read
+    timeout or 5xx may follow a committed write, and re-sending would
+    duplicate rows.
+    """
+    if not idempotent:
+        return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout))
+    if isinstance(error, httpx.TransportError):
+        # Includes httpx.TimeoutException
+        return True
+    if isinstance(error, APIError):
+        return str(error.code) in RETRYABLE_STATUS
+    return False
+
 class DatabaseManager:
     """
     Manages data storage and retrieval operations for the application.
     Supports dual-write to Supabase (Cloud PostgreSQL) and local Excel export.
+
+    Expects a 'shops' table whose columns match the scraped record keys
+    ("Shop Name", "Shop Type", "Rating", ...), with "Shop Name" as its
+    unique / conflict key so upserts update existing shops.
     """
     
-    def __init__(self, url: Optional[str] = None, key: Optional[str] = None):
+    def __init__(self, url: Optional[str] = None, key: Optional[str] = None,
+                 order_column: str = "Shop Name"):
         """
         Initializes the DatabaseManager.
 
         Args:
             url (Optional[str]): Supabase Project URL. Defaults to env var SUPABASE_URL.
             key (Optional[str]): Supabase API Key. Defaults to env var SUPABASE_KEY.
+            order_column (str): Unique column of the 'shops' table used to give
+                paginated exports a stable row order. Defaults to "Shop Name".
         """
         # Allow passing creds or grabbing from environment
         self.url = url or os.environ.get("SUPABASE_URL")
         self.key = key or os.environ.get("SUPABASE_KEY")
+        self.order_column = order_column
         self.client: Optional[Client] = None
         
         if self.url and self.key:
@@ -53,18 +115,56 @@ class DatabaseManager:
         # 1. Save to Cloud (if applicable)
         if self.client:
             print(f"[*] Uploading {len(data_list)} records to Supabase...")
+            batches = [data_list[i:i + UPLOAD_BATCH_SIZE] for i in range(0, len(data_list), UPLOAD_BATCH_SIZE)]
+            # Assuming table name 'shops'
+            written = 0
+            errors: List[Exception] = []
+            with ThreadPoolExecutor(max_workers=min(UPLOAD_MAX_WORKERS, len(batches))) as pool:
+                futures = [pool.submit(self._write_batch, batch, upsert) for batch in batches]
+                for batch, future in zip(batches, futures):
+                    try:
+                        future.result()
+                        written += len(batch)
+                    except Exception as e:
+                        errors.append(e)
+            
+            if errors:
+                # Batches run concurrently, so others may already be committed
+                if written:
+                    msg = f"Partial upload: {written} of {len(data_list)} records saved. First error: {errors[0]}"
+                else:
+                    msg = str(errors[0])
+                print(f"[-] Cloud upload failed: {msg}")
+                return False, msg
+            print("[+] Cloud upload successful.")
+        
+        return True, "Success"
+
+    def _write_batch(self, batch: List[Dict[str, Any]], upsert: bool) -> None:
+        """
+        Writes a single batch to the 'shops' table.
+
+        Transient failures are retried with exponential backoff and jitter
+        (inserts only when the connection itself failed, see _is_transient).
+
+        Args:
+            batch (List[Dict[str, Any]]): Slice of shop data dictionaries.
+            upsert (bool): If True, updates existing records based on unique keys.
+        """
+        for attempt in range(UPLOAD_MAX_RETRIES):
             try:
-                # Assuming table name 'shops'
+                table = self.client.table("shops")
                 if upsert:
-                    self.client.table("shops").upsert(data_list).execute()
+                    table.upsert(batch).execute()
                 else:
-                    self.client.table("shops").insert(data_list).execute()
-                print("[+] Cloud upload successful.")
+                    table.insert(batch).execute()
+                return
             except Exception as e:
-                print(f"[-] Cloud upload failed: {e}")
-                return False, str(e)
-        
-        return True, "Success"
+                if attempt == UPLOAD_MAX_RETRIES - 1 or not _is_transient(e, idempotent=upsert):
+                    raise
+                delay = 2 ** attempt + random.uniform(0, 1)
+                print(f"[!] Batch upload failed ({e}), retrying in {delay:.1f}s...")
+                time.sleep(delay)
 
     def export_from_cloud_to_excel(self, filename: Optional[str] = None) -> Optional[str]:
         """
@@ -82,22 +182,35 @@ class DatabaseManager:
             
         print("[*] Fetching data from Supabase...")
         try:
-            # Fetch all rows 
-            # Note: Supabase limits rows by default; massive datasets require pagination.
-            response = self.client.table("shops").select("*").execute()
-            data = response.data
+            # Fetch all rows page by page (Supabase silently caps a single select).
+            # Pages are ordered on a unique key so rows are neither skipped nor repeated,
+            # and we stop only on an empty page since the server's max-rows may be lower.
+            chunks: List[pd.DataFrame] = []
+            offset = 0
+            while True:
+                response = (
+                    self.client.table("shops")
+                    .select("*")
+                    .order(self.order_column)
+                    .range(offset, offset + EXPORT_PAGE_SIZE - 1)
+                    .execute()
+                )
+                if not response.data:
+                    break
+                chunks.append(pd.DataFrame(response.data))
+                offset += len(response.data)
             
-            if not data:
+            if not chunks:
                 print("[-] Cloud DB is empty.")
                 return None
                 
-            df = pd.DataFrame(data)
+            df = pd.concat(chunks, ignore_index=True)
             
             if not filename:
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                 filename = f"Cloud_Export_{timestamp}.xlsx"
                 
-            df.to_excel(filename, index=False)
+            save_to_excel(df, filename)
             print(f"[+] Exported cloud data to {filename}")
             return filename
             
@@ -4,13 +4,14 @@
 import os
 import pandas as pd
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from typing import List, Optional
 
 # Local Modules
 # Note: 'scraper' module replaces the old 'alappuzha_scraper'
 from scraper import scrape_with_serpapi, scrape_with_selenium
-from database_manager import DatabaseManager
+from database_manager import DatabaseManager, save_to_excel
 from market_analyst import analyze_market_data
 
 # Load environment variables
@@ -94,12 +95,13 @@ def run_pipeline() -> None:
             scraped_data = scrape_with_serpapi(serp_key, queries, location)
             
             if scraped_data:
-                # 2. Store
-                db_manager.save_data(scraped_data)
-                
-                # 3. Export to Excel (for Analyst)
+                # 2. Store & 3. Export to Excel (for Analyst), overlapped since both are I/O bound
                 excel_file = f"{location}_{datetime.now().strftime('%Y%m%d')}.xlsx"
-                pd.DataFrame(scraped_data).to_excel(excel_file, index=False)
+                with ThreadPoolExecutor(max_workers=2) as pool:
+                    xlsx_future = pool.submit(save_to_excel, pd.DataFrame.from_records(scraped_data), excel_file)
+                    db_future = pool.submit(db_manager.save_data, scraped_data)
+                    xlsx_future.result()
+                    db_future.result()
                 print(f"[+] Data saved locally to {excel_file}")
                 
                 # 4. Analyze
@@ -114,7 +116,8 @@ def run_pipeline() -> None:
                 print("[-] Need Gemini Key to run analysis!")
                 continue
                 
-            files = [f for f in os.listdir('.') if f.endswith('.xlsx')]
+            with os.scandir('.') as entries:
+                files = sorted(e.name for e in entries if e.is_file() and e.name.endswith('.xlsx'))
             if not files:
                 print("[-] No valid Excel files found to analyze.")
                 continue
@@ -1,26 +1,63 @@
 # Scraper Module for Market Agent
 # Handles data extraction via SerpApi and Selenium
 
+import os
+import re
+import functools
+import ijson
 import requests
-import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
-from webdriver_manager.chrome import ChromeDriverManager
-from typing import List, Dict, Any, Optional
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+from typing import List, Dict, Any, Optional, Set
 
 # =============================================================================
 # CONSTANTS
 # =============================================================================
 
 SERPAPI_URL = "https://serpapi.com/search.json"
+SERPAPI_MAX_WORKERS = 5       # Concurrent queries (well under SerpApi's burst limit)
+SERPAPI_MAX_RETRIES = 3       # Retries per query on throttling / transient server errors
+
+# One pooled session for all SerpApi calls: reuses TCP+TLS connections across
+# queries, and urllib3's Retry backs off on 429/5xx (honoring Retry-After).
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=8,
+    max_retries=Retry(
+        total=SERPAPI_MAX_RETRIES,
+        backoff_factor=1,
+        status_forcelist=[429, 502, 503, 504],
+        allowed_methods=frozenset(["GET"]),
+        raise_on_status=False,
+    ),
+))
+
+# Google Maps result cards, and a script that returns each card's text lines
+# in a single WebDriver round-trip (instead of one RPC per element)
+MAPS_RESULT_SELECTOR = "div[role='article']"
+MAPS_HARVEST_JS = (
+    "return Array.from(document.querySelectorAll(arguments[0]))"
+    ".map(e => e.innerText.split('\\n'));"
+)
+
+# Category is everything before the first standalone "in" token (e.g. "textile shops in Kochi"),
+# including a trailing "in" left by an empty location ("textile shops in ")
+_SHOP_TYPE_RE = re.compile(r"^\s*(?:(.*?)\s+)?in(?:\s|$)")
 
 # =============================================================================
 # HELPER FUNCTIONS
 # =============================================================================
 
+@functools.lru_cache(maxsize=256)
 def extract_shop_type(query: str) -> str:
     """
     Extracts the shop type from a search query string.
@@ -31,19 +68,62 @@ def extract_shop_type(query: str) -> str:
     Returns:
         str: The extracted shop category (e.g., "Textile Shops").
     """
+    # Collapse runs of whitespace so "textile  shops" and "textile shops" are one category
     words = query.split()
-    if len(words) > 2 and "in" in words:
-        return " ".join(words[:words.index("in")]).title()
-    return query.title()
+    if len(words) > 2:
+        match = _SHOP_TYPE_RE.match(query)
+        if match:
+            return " ".join((match.group(1) or "").split()).title()
+    return " ".join(words).title()
 
 # =============================================================================
 # OPTION 1: SERPAPI (RECOMMENDED)
 # =============================================================================
 
+def _fetch_local_results(api_key: str, query: str) -> List[Dict[str, Any]]:
+    """
+    Runs a single SerpApi Google Maps search.
+
+    Args:
+        api_key (str): Your SerpApi API Key.
+        query (str): The search query.
+
+    Returns:
+        List[Dict[str, Any]]: The raw 'local_results' entries, or an empty list on failure.
+    """
+    print(f"  - Searching for: {query}")
+    try:
+        params = {
+            "q": query,
+            "api_key": api_key,
+            "engine": "google_maps",
+            "type": "search",
+        }
+        
+        response = _session.get(SERPAPI_URL, params=params, timeout=10, stream=True)
+        
+        # Close the streamed response on every path (including HTTP errors)
+        # so its pooled connection is released
+        with response:
+            response.raise_for_status()
+            
+            # Parse places straight off the socket, skipping the rest of the payload
+            response.raw.decode_content = True
+            return list(ijson.items(response.raw, "local_results.item", use_float=True))
+        
+    except requests.exceptions.RequestException as e:
+        print(f"Network error scraping {query}: {e}")
+    except Exception as e:
+        print(f"Error scraping {query}: {e}")
+    return []
+
 def scrape_with_serpapi(api_key: str, queries: List[str], location_name: str) -> List[Dict[str, Any]]:
     """
     Scrapes shop data using the SerpApi Google Maps Engine.
 
+    Queries are I/O-bound, so they are issued concurrently; results are
+    merged in query order so de-duplication is deterministic.
+
     Args:
         api_key (str): Your SerpApi API Key.
         queries (List[str]): List of search queries.
@@ -55,51 +135,34 @@ def scrape_with_serpapi(api_key: str, queries: List[str], location_name: str) ->
     print(f"[*] Scraping {len(queries)} categories in {location_name} using SerpApi...")
     
     shops_data: List[Dict[str, Any]] = []
+    seen_names: Set[str] = set()
     
-    for query in queries:
-        print(f"  - Searching for: {query}")
-        try:
-            params = {
-                "q": query,
-                "api_key": api_key,
-                "engine": "google_maps",
-                "type": "search",
-            }
-            
-            response = requests.get(SERPAPI_URL, params=params, timeout=10)
-            response.raise_for_status()
-            results = response.json()
-            
-            if "local_results" in results:
-                for place in results["local_results"]:
-                    title = place.get("title", "N/A")
-                    
-                    # Avoid duplicates
-                    if any(s['Shop Name'] == title for s in shops_data):
-                        continue
-                        
-                    shop = {
-                        "Shop Name": title,
-                        "Shop Type": extract_shop_type(query),
-                        "Rating": place.get("rating", "N/A"),
-                        "Reviews": place.get("reviews", 0),
-                        "Address": place.get("address", "N/A"),
-                        "Phone": place.get("phone", "N/A"),
-                        "Website": place.get("website", "N/A"),
-                        "Open Status": place.get("open_state", "N/A"),
-                        "latitude": place.get("gps_coordinates", {}).get("latitude"),
-                        "longitude": place.get("gps_coordinates", {}).get("longitude"),
-                        "Source": "SerpApi"
-                    }
-                    shops_data.append(shop)
-            
-            # Rate limiting
-            time.sleep(1)
+    with ThreadPoolExecutor(max_workers=max(1, min(SERPAPI_MAX_WORKERS, len(queries)))) as pool:
+        all_results = list(pool.map(lambda q: _fetch_local_results(api_key, q), queries))
+    
+    for query, places in zip(queries, all_results):
+        for place in places:
+            title = place.get("title", "N/A")
             
-        except requests.exceptions.RequestException as e:
-            print(f"Network error scraping {query}: {e}")
-        except Exception as e:
-            print(f"Error scraping {query}: {e}")
+            # Avoid duplicates
+            if title in seen_names:
+                continue
+                
+            shop = {
+                "Shop Name": title,
+                "Shop Type": extract_shop_type(query),
+                "Rating": place.get("rating", "N/A"),
+                "Reviews": place.get("reviews", 0),
+                "Address": place.get("address", "N/A"),
+                "Phone": place.get("phone", "N/A"),
+                "Website": place.get("website", "N/A"),
+                "Open Status": place.get("open_state", "N/A"),
+                "latitude": place.get("gps_coordinates", {}).get("latitude"),
+                "longitude": place.get("gps_coordinates", {}).get("longitude"),
+                "Source": "SerpApi"
+            }
+            seen_names.add(title)
+            shops_data.append(shop)
             
     return shops_data
 
@@ -122,18 +185,22 @@ def scrape_with_selenium(queries: List[str]) -> List[Dict[str, Any]]:
     shops_data: List[Dict[str, Any]] = []
     
     options = webdriver.ChromeOptions()
-    options.add_argument("--start-maximized")
+    options.add_argument("--window-size=1920,1080") # Consistent results-panel layout (headless ignores --start-maximized)
     options.add_argument("--disable-notifications")
     options.add_argument("--no-sandbox") # Crucial for Docker
     options.add_argument("--disable-dev-shm-usage") # Crucial for Docker
     
-    # Run headless if in Docker or requested
-    if os.environ.get("HEADLESS_MODE") == "true":
-        options.add_argument("--headless")
+    # Run headless unless explicitly disabled (set HEADLESS_MODE=false to watch the browser)
+    if os.environ.get("HEADLESS_MODE", "true").lower() != "false":
+        options.add_argument("--headless=new")
+        options.add_argument("--disable-gpu")
+    options.add_argument("--blink-settings=imagesEnabled=false") # Skip image downloads/decoding
+    options.page_load_strategy = "eager" # Return at DOMContentLoaded; results are awaited explicitly
     
     driver = None
     try:
-        driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+        # Selenium Manager (built into Selenium 4) resolves the driver binary locally
+        driver = webdriver.Chrome(options=options)
     except Exception as e:
         print(f"Error initializing Chrome driver: {e}")
         return []
@@ -142,15 +209,21 @@ def scrape_with_selenium(queries: List[str]) -> List[Dict[str, Any]]:
         for query in queries:
             url = f"https://www.google.com/maps/search/{query.replace(' ', '+')}"
             driver.get(url)
-            time.sleep(5) # Wait for page load
+            try:
+                # Wait only as long as the results take to render
+                WebDriverWait(driver, 10).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, MAPS_RESULT_SELECTOR))
+                )
+            except TimeoutException:
+                print(f"  - no results loaded for {query}, skipping.")
+                continue
             
             print(f"  - extracting results for {query}...")
             
-            elements = driver.find_elements(By.CSS_SELECTOR, "div[role='article']")
+            rows = driver.execute_script(MAPS_HARVEST_JS, MAPS_RESULT_SELECTOR) or []
             
-            for elem in elements:
+            for text in rows:
                 try:
-                    text = elem.text.split('\n')
                     if len(text) > 0:
                         name = text[0]
                         rating = "N/A"
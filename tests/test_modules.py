@@ -1,12 +1,18 @@
 import pytest
 import sys
 import os
+import io
+import json
 from unittest.mock import MagicMock, patch
 
+import httpx
+import requests
+from postgrest.exceptions import APIError
+
 # Add parent dir to path so we can import modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from scraper import extract_shop_type
+from scraper import extract_shop_type, scrape_with_serpapi
 from database_manager import DatabaseManager
 
 # =============================================================================
@@ -28,6 +34,46 @@ def test_extract_shop_type_complex_location():
     query = "best restaurants in new york city"
     assert extract_shop_type(query) == "Best Restaurants"
 
+def test_extract_shop_type_extra_whitespace():
+    """Test repeated spaces in user input do not create a separate category."""
+    assert extract_shop_type("textile  shops in  Kochi") == "Textile Shops"
+    assert extract_shop_type(" gyms   Kochi ") == "Gyms Kochi"
+
+def test_extract_shop_type_empty_location():
+    """Test a trailing 'in' (empty location) is not folded into the category."""
+    assert extract_shop_type("textile shops in ") == "Textile Shops"
+    assert extract_shop_type("shops in") == "Shops In"
+
+def test_scrape_with_serpapi_merges_in_query_order():
+    """Test concurrent queries are merged in query order with duplicates dropped."""
+    pages = {
+        "gyms in Kochi": [{"title": "Iron Gym", "rating": 4.5}, {"title": "Shared Spot"}],
+        "cafes in Kochi": [{"title": "Shared Spot"}, {"title": "Bean Bar"}],
+    }
+
+    def fake_get(url, params=None, timeout=None, stream=False):
+        body = {"search_metadata": {}, "local_results": pages[params["q"]]}
+        response = MagicMock(status_code=200)
+        response.raw = io.BytesIO(json.dumps(body).encode())
+        return response
+
+    with patch("scraper._session.get", side_effect=fake_get):
+        shops = scrape_with_serpapi("fake-key", list(pages), "Kochi")
+
+    assert [s["Shop Name"] for s in shops] == ["Iron Gym", "Shared Spot", "Bean Bar"]
+    assert shops[1]["Shop Type"] == "Gyms"
+
+def test_scrape_with_serpapi_closes_error_responses():
+    """Test a streamed HTTP error response is closed so its connection is released."""
+    response = MagicMock(status_code=503)
+    response.raise_for_status.side_effect = requests.exceptions.HTTPError("503 Server Error")
+
+    with patch("scraper._session.get", return_value=response):
+        shops = scrape_with_serpapi("fake-key", ["gyms in Kochi"], "Kochi")
+
+    assert shops == []
+    response.__exit__.assert_called_once()
+
 # =============================================================================
 # UNIT TESTS: Database Manager
 # =============================================================================
@@ -51,3 +97,101 @@ def test_save_data_empty():
     success, msg = db.save_data([])
     assert success is False
     assert msg == "No data to save"
+
+def test_save_data_uploads_in_batches():
+    """Test large uploads are split into bounded upsert batches."""
+    with patch("database_manager.create_client") as mock_create:
+        db = DatabaseManager(url="http://fake.url", key="fake-key")
+        records = [{"Shop Name": f"Shop {i}"} for i in range(1200)]
+        success, _ = db.save_data(records)
+
+    table = mock_create.return_value.table.return_value
+    sizes = sorted(len(call.args[0]) for call in table.upsert.call_args_list)
+    assert success is True
+    assert sizes == [200, 500, 500]
+
+def test_save_data_retries_transient_errors():
+    """Test network errors and 5xx statuses are retried, then the batch succeeds."""
+    with patch("database_manager.create_client") as mock_create, \
+         patch("database_manager.time.sleep") as mock_sleep:
+        db = DatabaseManager(url="http://fake.url", key="fake-key")
+        execute = mock_create.return_value.table.return_value.upsert.return_value.execute
+        execute.side_effect = [
+            httpx.ConnectError("connection reset"),
+            APIError({"message": "JSON could not be generated", "code": 503}),
+            MagicMock(),
+        ]
+        success, _ = db.save_data([{"Shop Name": "A"}])
+
+    assert success is True
+    assert execute.call_count == 3
+    assert mock_sleep.call_count == 2
+
+def test_save_data_does_not_retry_permanent_errors():
+    """Test PostgREST error codes and programming errors fail fast without retrying."""
+    for error in (APIError({"message": "bad column", "code": "PGRST204"}), TypeError("not serializable")):
+        with patch("database_manager.create_client") as mock_create, \
+             patch("database_manager.time.sleep") as mock_sleep:
+            db = DatabaseManager(url="http://fake.url", key="fake-key")
+            execute = mock_create.return_value.table.return_value.upsert.return_value.execute
+            execute.side_effect = error
+            success, _ = db.save_data([{"Shop Name": "A"}])
+
+        assert success is False
+        assert execute.call_count == 1
+        mock_sleep.assert_not_called()
+
+def test_save_data_insert_does_not_retry_read_timeout():
+    """Test inserts are not re-sent after a read timeout (the write may have committed)."""
+    with patch("database_manager.create_client") as mock_create, \
+         patch("database_manager.time.sleep") as mock_sleep:
+        db = DatabaseManager(url="http://fake.url", key="fake-key")
+        execute = mock_create.return_value.table.return_value.insert.return_value.execute
+        execute.side_effect = [httpx.ReadTimeout("timed out"), MagicMock()]
+        success, _ = db.save_data([{"Shop Name": "A"}], upsert=False)
+
+    assert success is False
+    assert execute.call_count == 1
+    mock_sleep.assert_not_called()
+
+def test_save_data_reports_partial_upload():
+    """Test a failure after other batches were written is reported as partial."""
+    with patch("database_manager.create_client") as mock_create, \
+         patch("database_manager.UPLOAD_MAX_WORKERS", 1):
+        db = DatabaseManager(url="http://fake.url", key="fake-key")
+        execute = mock_create.return_value.table.return_value.upsert.return_value.execute
+        execute.side_effect = [MagicMock(), TypeError("not serializable")]
+        records = [{"Shop Name": f"Shop {i}"} for i in range(600)]
+        success, msg = db.save_data(records)
+
+    assert success is False
+    assert msg.startswith("Partial upload: 500 of 600 records saved")
+
+def test_export_from_cloud_pages_through_table(tmp_path):
+    """Test cloud export requests ordered ranges until an empty page is returned."""
+    with patch("database_manager.create_client") as mock_create, \
+         patch("database_manager.EXPORT_PAGE_SIZE", 2):
+        db = DatabaseManager(url="http://fake.url", key="fake-key")
+        query = mock_create.return_value.table.return_value.select.return_value.order.return_value
+        query.range.return_value.execute.side_effect = [
+            MagicMock(data=[{"Shop Name": "A"}, {"Shop Name": "B"}]),
+            MagicMock(data=[{"Shop Name": "C"}]),
+            MagicMock(data=[]),
+        ]
+        out_file = db.export_from_cloud_to_excel(str(tmp_path / "export.xlsx"))
+
+    mock_create.return_value.table.return_value.select.return_value.order.assert_called_with("Shop Name")
+    assert [call.args for call in query.range.call_args_list] == [(0, 1), (2, 3), (3, 4)]
+    assert out_file == str(tmp_path / "export.xlsx")
+
+def test_export_from_cloud_fails_visibly_on_bad_order_column(capsys):
+    """Test a missing order column aborts the export with a reported error."""
+    with patch("database_manager.create_client") as mock_create:
+        db = DatabaseManager(url="http://fake.url", key="fake-key", order_column="id")
+        select = mock_create.return_value.table.return_value.select.return_value
+        select.order.side_effect = APIError({"message": "column shops.id does not exist", "code": "42703"})
+        out_file = db.export_from_cloud_to_excel()
+
+    select.order.assert_called_once_with("id")
+    assert out_file is None
+    assert "Export failed" in capsys.readouterr().out